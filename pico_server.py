@@ -0,0 +1,514 @@
+#Copyright (C) 2023 Andrew Durbin
+
+#This program is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#This program is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from typing import Callable
+from machine import Pin, ADC, mem32
+import uasyncio as asyncio
+import array
+import binascii
+import math
+import os
+import gc
+import _thread
+import time
+import network
+import micropython
+import userconstants
+
+# Onboard led
+watchdog_led = Pin("LED",Pin.OUT)
+http_connection_led = Pin(20,Pin.OUT)
+user_led = Pin(16,Pin.OUT)
+
+temp_low_crit_thresh_led = Pin(2,Pin.OUT)
+temp_low_warn_thresh_led = Pin(3,Pin.OUT)
+temp_ok_thresh_led = Pin(4,Pin.OUT)
+temp_high_warn_thresh_led = Pin(5,Pin.OUT)
+temp_high_crit_thresh_led = Pin(6,Pin.OUT)
+
+watchdog_led.value(0)
+http_connection_led.value(0)
+user_led.value(0)
+
+temp_low_crit_thresh_led.value(0)
+temp_low_warn_thresh_led.value(0)
+temp_ok_thresh_led.value(0)
+temp_high_warn_thresh_led.value(0)
+temp_high_crit_thresh_led.value(0)
+
+# One-hot GPIO masks of the threshold leds from coldest to hottest, matching the pins above
+_THRESH_MASKS = (1 << 2, 1 << 3, 1 << 4, 1 << 5, 1 << 6)
+_THRESH_MASK_ALL = 0x7C
+# RP2040 SIO registers for atomically setting/clearing GPIO outputs
+# See https://datasheets.raspberrypi.com/rp2040/rp2040-datasheet.pdf
+_SIO_GPIO_OUT_SET = 0xd0000014
+_SIO_GPIO_OUT_CLR = 0xd0000018
+# Lower bound in degrees F of each threshold, a reading belongs to the highest one it reaches
+_THRESH_LO = array.array('h', [-40,32,37,60,86])
+
+# Normalize the raw 0-65535 adc output value to 0-3.3 voltage scale
+# Sensor outputs 27 degrees Celcius at 0.706 Volts and decreases 1.721 mV per degree Celcius
+# See See https://datasheets.raspberrypi.com/rp2040/rp2040-datasheet.pdf
+# Folded with the standard unit conversion into temp_f = _TEMP_F_OFFSET - _TEMP_F_PER_COUNT * raw
+_TEMP_F_PER_COUNT = (3.3/65535) * (1.8/0.001721)
+_TEMP_F_OFFSET = 32 + 1.8 * (27 + 0.706/0.001721)
+# Each reading averages 2**_ADC_SAMPLES_SHIFT adc samples to smooth out sensor noise
+_ADC_SAMPLES_SHIFT = 4
+# Applied to the whole sample sum so averaging keeps its extra resolution
+_TEMP_F_PER_SAMPLE_SUM = _TEMP_F_PER_COUNT / (1 << _ADC_SAMPLES_SHIFT)
+
+# Watchdog period, kept slow so it rarely competes with handle_client for the scheduler
+_TICK_MS = 500
+# Temp sample period on core 1
+_SAMPLE_MS = 1000
+
+# Static parts of the http responses, built once at import rather than per request
+_INDEX_PREFIX = (
+    b"HTTP/1.0 200 OK\r\nContent-type: text/html\r\n\r\n"
+    b"<!DOCTYPE html><html>"
+    b"<head><title>Micro Python Server Version 0.2.1</title></head>"
+    b"<body>"
+    b"<h1>uasyncio Server</h1>"
+    b"<p>Current Pi Pico Temp Sensor: "
+)
+_INDEX_MIN = b" degrees F (Min:"
+_INDEX_MAX = b" Max:"
+#Need to rework this...
+_INDEX_SUFFIX = (
+    b")</p>"
+    b"<h2>Control User Led:</h2>"
+    b"<form action=\"\" method=\"post\"><input type=\"submit\" name=\"toggle_led\" value=\"On\" /></form>"
+    b"<form action=\"\" method=\"post\"><input type=\"submit\" name=\"toggle_led\" value=\"Off\" /></form>"
+    b"<a href=\"/garden_temps\">See Historical Temperature</a>"
+    b"</body>"
+    b"</html>"
+)
+
+# The page's ETag goes between the status and the rest of the prefix
+_GARDEN_STATUS = b"HTTP/1.0 200 OK\r\nContent-type: text/html\r\nCache-Control: no-cache\r\nETag: "
+_GARDEN_PREFIX = (
+    b"\r\n\r\n"
+    b"<!DOCTYPE html><html>"
+    b"<head><title>Micro Python Server</title></head>"
+    b"<body>"
+)
+_GARDEN_CSS = b"""
+        <style type="text/css">
+        .tg  {border-collapse:collapse;border-spacing:0;}
+        .tg td{border-color:black;border-style:solid;border-width:1px;font-family:Arial, sans-serif;font-size:14px;
+          overflow:hidden;padding:10px 5px;word-break:normal;}
+        .tg th{border-color:black;border-style:solid;border-width:1px;font-family:Arial, sans-serif;font-size:14px;
+          font-weight:normal;overflow:hidden;padding:10px 5px;word-break:normal;}
+        .tg .tg-0lax{text-align:left;vertical-align:top}
+        </style>
+        <table class="tg">
+        <thead>
+          <tr>
+            <th class="tg-0lax">Threshold</th>
+            <th class="tg-0lax">Range</th>
+            <th class="tg-0lax">Time in Range</th>
+          </tr>
+        </thead>
+        <tbody>"""
+# One row per temperature threshold, the time in range is inserted after each
+_GARDEN_ROWS = (
+    b"""
+          <tr>
+            <td class="tg-0lax">Freezing</td>
+            <td class="tg-0lax">-40 to 32F</td>
+            <td class="tg-0lax">""",
+    b"""
+          <tr>
+            <td class="tg-0lax">'Areas of Frost'<br></td>
+            <td class="tg-0lax">32 to 37F</td>
+            <td class="tg-0lax">""",
+    b"""
+          <tr>
+            <td class="tg-0lax">Frost or Cold</td>
+            <td class="tg-0lax">37 to 60F</td>
+            <td class="tg-0lax">""",
+    b"""
+          <tr>
+            <td class="tg-0lax">Cool Weather Vegetables</td>
+            <td class="tg-0lax">60 to 85F</td>
+            <td class="tg-0lax">""",
+    b"""
+          <tr>
+            <td class="tg-0lax">Hot enough for anything else</td>
+            <td class="tg-0lax">86F+</td>
+            <td class="tg-0lax">"""
+)
+_GARDEN_ROW_END = b"""</td>
+          </tr>"""
+_GARDEN_SUFFIX = b"""
+        </tbody>
+        </table>
+        </body></html>"""
+
+# The ETag is repeated after this, then the blank line ending the response
+_NOT_MODIFIED = b"HTTP/1.0 304 Not Modified\r\nETag: "
+
+_NOT_FOUND = b"""HTTP/1.0 404 Not Found\r\nContent-type: text/html\r\n\r\n
+            <!DOCTYPE html><html>
+            <head><title>Micro Python Server</title></head>
+            <body><h1>Bad Path</h1><p>you shouldn't be here</p></body>
+            </html>
+        """
+
+# Request headers beyond this are ignored
+_RX_SIZE = 512
+
+# Large enough for the garden page with five multi-week durations
+_TX_SIZE = 2560
+# The index page's three temps are at most a few digits each
+_INDEX_TX_SIZE = len(_INDEX_PREFIX) + len(_INDEX_MIN) + len(_INDEX_MAX) + len(_INDEX_SUFFIX) + 48
+
+# (divisor, unit) pairs from largest to smallest, seconds are appended last
+_DURATION_UNITS = (
+    (604800, b" weeks "),
+    (86400, b" days "),
+    (3600, b" hours "),
+    (60, b" mins ")
+)
+_DURATION_SECS = b" secs"
+
+@micropython.native
+def _put(buf, pos:int, data) -> int:
+    """Copy data into buf at pos, return the position after it"""
+    end = pos + len(data)
+    buf[pos:end] = data
+    return end
+
+@micropython.native
+def _put_int(buf, pos:int, value:int) -> int:
+    """Write a non-negative int as ASCII digits into buf at pos, return the position after it"""
+    start = pos
+    while True:
+        # % and // on small ints allocate nothing, unlike divmod's result tuple
+        buf[pos] = 48 + value % 10
+        value //= 10
+        pos += 1
+        if value == 0:
+            break
+    # Digits were written least significant first
+    end = pos - 1
+    while start < end:
+        buf[start],buf[end] = buf[end],buf[start]
+        start += 1
+        end -= 1
+    return pos
+
+@micropython.native
+def _put_tenths(buf, pos:int, value:int) -> int:
+    """Write an int count of tenths as ASCII like '-72.3' into buf at pos, return the position after it"""
+    if value < 0:
+        buf[pos] = 45
+        pos += 1
+        value = -value
+    pos = _put_int(buf,pos,value // 10)
+    buf[pos] = 46
+    buf[pos+1] = 48 + value % 10
+    return pos + 2
+
+@micropython.native
+def _put_duration(buf, pos:int, seconds:int) -> int:
+    """Write seconds as 'N weeks N days N hours N mins N secs' into buf, skipping leading zero units"""
+    # ...micropython also missing datetime module
+    for divisor,unit in _DURATION_UNITS:
+        count = seconds // divisor
+        seconds = seconds % divisor
+        if count > 0:
+            pos = _put_int(buf,pos,count)
+            pos = _put(buf,pos,unit)
+    pos = _put_int(buf,pos,seconds)
+    return _put(buf,pos,_DURATION_SECS)
+
+def header_value(header:bytes, name:bytes) -> bytes:
+    """Return the value of the named header from a request header block, or None if absent.
+    The name must include the trailing colon and be lowercase, header names match in any case"""
+    start = header.lower().find(b"\r\n" + name)
+    if start < 0:
+        return None
+    start += 2 + len(name)
+    end = header.find(b"\r\n",start)
+    if end < 0:
+        end = len(header)
+    return header[start:end].strip()
+
+@micropython.native
+def _fill_index(buf, temp_f) -> int:
+    """Render the index page into buf for (latest, min, max) temps in tenths of a degree, return the number of bytes used"""
+    pos = _put(buf,0,_INDEX_PREFIX)
+    pos = _put_tenths(buf,pos,temp_f[0])
+    pos = _put(buf,pos,_INDEX_MIN)
+    pos = _put_tenths(buf,pos,temp_f[1])
+    pos = _put(buf,pos,_INDEX_MAX)
+    pos = _put_tenths(buf,pos,temp_f[2])
+    return _put(buf,pos,_INDEX_SUFFIX)
+
+@micropython.native
+def _fill_garden(buf, thresh_times, etag:bytes) -> int:
+    """Render the garden temperature page into buf, return the number of bytes used"""
+    pos = _put(buf,0,_GARDEN_STATUS)
+    pos = _put(buf,pos,etag)
+    pos = _put(buf,pos,_GARDEN_PREFIX)
+    pos = _put(buf,pos,_GARDEN_CSS)
+    for idx,row in enumerate(_GARDEN_ROWS):
+        pos = _put(buf,pos,row)
+        pos = _put_duration(buf,pos,thresh_times[idx])
+        pos = _put(buf,pos,_GARDEN_ROW_END)
+    return _put(buf,pos,_GARDEN_SUFFIX)
+
+@micropython.native
+def thresh_index(temp_f:int) -> int:
+    """Binary search _THRESH_LO for the threshold a temp falls in, colder than all count as the first"""
+    lo = 0
+    hi = len(_THRESH_LO) - 1
+    while lo < hi:
+        mid = (lo + hi + 1) >> 1
+        if temp_f < _THRESH_LO[mid]:
+            hi = mid - 1
+        else:
+            lo = mid
+    return lo
+
+def blink_led(_func=None, *, led=watchdog_led):
+    """ Define a decorator with an optional led argument.
+    Keep the led on for the duration of the function decorated"""
+    def decorator_blink_led(func):
+        """ Would use functools...but seems unavailable in this env. """
+        # None of the decorated functions take keyword arguments, so skip building a kwargs dict
+        def wrapper_blink(*args):
+            led.toggle()
+            return func(*args)
+        return wrapper_blink
+    if _func is None:
+        return decorator_blink_led
+    return decorator_blink_led(_func)
+
+@blink_led(led=watchdog_led)
+async def poll_wifi_status():
+    """A short blink every second while waiting for wifi to connect"""
+    await asyncio.sleep_ms(1000)
+
+async def wifi_connect(ssid:str, passwd:str):
+    """Connect to the requested WIFI network"""
+    wlan = network.WLAN(network.STA_IF)
+    wlan.active(True)
+    wlan.connect(ssid,passwd)
+    while wlan.status() != 3:
+        await poll_wifi_status()
+    print(f"Connected: {wlan.ifconfig()[0]}")
+
+async def read_header(reader, buf:bytearray) -> bytes:
+    """Read the request header block into buf in as few reads as possible.
+    Returns the bytes read, which end at or before the blank line terminating the headers"""
+    mv = memoryview(buf)
+    # Older uasyncio streams only offer read()
+    readinto = getattr(reader,"readinto",None)
+    n = 0
+    header = b""
+    while n < len(buf):
+        if readinto is not None:
+            got = await readinto(mv[n:])
+        else:
+            chunk = await reader.read(len(buf) - n)
+            got = len(chunk)
+            buf[n:n+got] = chunk
+        if not got:
+            break
+        n += got
+        header = bytes(mv[:n])
+        end = header.find(b"\r\n\r\n")
+        if end >= 0:
+            return header[:end]
+    return header
+
+class PicoServer():
+    """Implement a uasyncio http server, and a temperature logger from the Pi Pico temp sensor"""
+    watchdog_val = 0
+    # Temps are kept as int tenths of a degree F
+    temp_f_latest = 0
+    # So the first value set with min() overrides it
+    temp_f_min = 10000
+    temp_f_max = 0
+
+    @micropython.native
+    def watchdog(self):
+        """The forever repeating watchdog task, just up a value, and blink a led"""
+        watchdog_led.toggle()
+        self.watchdog_val = self.watchdog_val + 1
+        
+    def get_route(self, path:str) -> Callable:
+        """Returns a callable generating an html response for the path given"""
+        if path == '/':
+            return self.index_page
+        if path == '/garden_temps':
+            return self.garden_temp_page
+        if path == '/method=%22post%22?toggle_led=On':
+            return self.led_on
+        if path == '/method=%22post%22?toggle_led=Off':
+            return self.led_off
+        return self.not_found
+
+    def __init__(self):
+        self.temp_f_latest = 0
+        # Seconds in each threshold
+        self.thresh_times = array.array('I', [0,0,0,0,0])
+        # Response buffer reused by each request, sized for the garden page
+        self._tx = bytearray(_TX_SIZE)
+        # Separate buffer for the index page so it doesn't overwrite the cached garden page
+        self._index_tx = bytearray(_INDEX_TX_SIZE)
+        # (etag, length) of the garden page currently rendered in _tx
+        self._garden_cache = None
+        # Random per boot so tags from before a reset never match, ticks_ms() at startup repeats every boot
+        self._boot_id = binascii.hexlify(os.urandom(4))
+        # Onboard temp sensor
+        self._adc = ADC(4)
+        # Guards the temp values shared between the core 1 sampler and the http server
+        self._lock = _thread.allocate_lock()
+
+    @micropython.native
+    def read_temp(self) -> float:
+        """ Returns the temperature in Farenheit, averaged over a burst of adc samples """
+        read_u16 = self._adc.read_u16
+        raw = 0
+        for _ in range(1 << _ADC_SAMPLES_SHIFT):
+            raw += read_u16()
+        return _TEMP_F_OFFSET - _TEMP_F_PER_SAMPLE_SUM * raw
+
+    @micropython.native
+    def update_temp(self):
+        """Take a temp reading and account it to the threshold it falls in"""
+        temp_f = self.read_temp()
+        # Rounded tenths are only for display, the range comes from the raw reading
+        t = round(temp_f * 10)
+        with self._lock:
+            self.temp_f_latest = t
+            self.temp_f_min = min(self.temp_f_min,t)
+            self.temp_f_max = max(self.temp_f_max,t)
+        # Calculate threshold temp is in
+        on_idx = thresh_index(math.floor(temp_f))
+        mem32[_SIO_GPIO_OUT_CLR] = _THRESH_MASK_ALL
+        mem32[_SIO_GPIO_OUT_SET] = _THRESH_MASKS[on_idx]
+        with self._lock:
+            self.thresh_times[on_idx] = self.thresh_times[on_idx] + 1
+
+    def cache_temp(self):
+        """Never exiting temp sampler, run on core 1 so it keeps time regardless of http load"""
+        while True:
+            self.update_temp()
+            # Its not necessary to poll it quicker than it can be read by a human
+            time.sleep_ms(_SAMPLE_MS)
+
+    async def watchdog_loop(self):
+        """Never exiting watchdog task"""
+        while True:
+            self.watchdog()
+            await asyncio.sleep_ms(_TICK_MS)
+
+    async def index_page(self,method,path,header,reader,writer):
+        """Return the basic index page """
+        del method, path, header, reader
+        with self._lock:
+            temp_f = (self.temp_f_latest, self.temp_f_min, self.temp_f_max)
+        mv = memoryview(self._index_tx)
+        writer.write(mv[:_fill_index(mv, temp_f)])
+        await writer.drain()
+        await writer.wait_closed()
+
+    async def garden_temp_page(self,method,path,header,reader,writer):
+        """Return the HTML temperature history table, or 304 if the client's copy is current"""
+        del method, path, reader
+        # Tag and page are both built from this one snapshot of the counts
+        with self._lock:
+            thresh_times = array.array('I', self.thresh_times)
+        # Every sample adds one to the total, so within a boot it identifies the counts
+        etag = b'"' + self._boot_id + b'-' + str(sum(thresh_times)).encode() + b'"'
+        mv = memoryview(self._tx)
+        if header_value(header,b"if-none-match:") == etag:
+            writer.write(b"".join([_NOT_MODIFIED, etag, b"\r\n\r\n"]))
+        else:
+            if self._garden_cache is None or self._garden_cache[0] != etag:
+                self._garden_cache = (etag, _fill_garden(mv, thresh_times, etag))
+            writer.write(mv[:self._garden_cache[1]])
+        await writer.drain()
+        await writer.wait_closed()
+
+    async def led_on(self,method,path,header,reader,writer):
+        """Turn the led on and continue to the index page"""
+        user_led.value(1)
+        await self.index_page(method,path,header,reader,writer)
+
+    async def led_off(self,method,path,header,reader,writer):
+        """Turn the led off and continue to the index page"""
+        user_led.value(0)
+        await self.index_page(method,path,header,reader,writer)
+
+    async def not_found(self,method,path,header,reader,writer):
+        """Return a basic page for HTTP404"""
+        del method, path, header, reader
+        writer.write(_NOT_FOUND)
+        await writer.drain()
+        await writer.wait_closed()
+
+    @blink_led(led=http_connection_led)
+    async def handle_client(self,reader,writer):
+        """Handle an http client connection"""
+        method=""
+        path=""
+        header = await read_header(reader, bytearray(_RX_SIZE))
+        line_end = header.find(b"\r\n")
+        if line_end < 0:
+            line_end = len(header)
+        # Request line is "METHOD PATH VERSION", slice it without splitting the header
+        method_end = header.find(b" ",0,line_end)
+        path_end = header.find(b" ",method_end+1,line_end)
+        if 0 < method_end < path_end:
+            method=header[:method_end].decode("utf8")
+            path=header[method_end+1:path_end].decode("utf8")
+            print(f"Req {method} {path}")
+        route=self.get_route(path)
+        try:
+            await route(method,path,header,reader,writer)
+        finally:
+            # Free this request's garbage now rather than leaving it to fragment the heap,
+            # including when the client drops mid-response
+            gc.collect()
+
+async def http_server_start(coroutine,port):
+    """Start an http server on the requested port"""
+    loop = asyncio.get_event_loop()
+    loop.create_task(asyncio.start_server(coroutine, '0.0.0.0', port))
+    print(f"Server Started on port {port}")
+    loop.run_forever()
+
+async def main_loop():
+    """Start a watchdog, http server, and temp sensor reader"""
+    server=PicoServer()
+    # Collect early, before the heap fragments enough to slow every allocation
+    gc.threshold(gc.mem_free() // 4 + gc.mem_alloc())
+    # The network stack isn't safe to use from core 1, so only the sampler moves there
+    _thread.start_new_thread(server.cache_temp, ())
+    tasks = [
+        asyncio.create_task(server.watchdog_loop()),
+        asyncio.create_task(http_server_start(server.handle_client,80))
+    ]
+    await asyncio.gather(*tasks, return_exceptions=False)
+
+def main():
+    """Connect to wifi then run the server forever"""
+    asyncio.run(wifi_connect(userconstants.SSID,userconstants.PASSWORD))
+    asyncio.run(main_loop())